@@ -1,18 +1,62 @@
 import argparse
+import array
+import asyncio
+import hashlib
+import json
 import os
 import re
+import signal
 import sqlite3
 import sys
 import textwrap
-from collections import Counter
-from copy import deepcopy
+import time
+from collections import Counter, defaultdict
+from functools import lru_cache
 
 import alive_progress
 import getch
+import httpx
 import openai
 import prompt_toolkit
+import prompt_toolkit.patch_stdout
 from prettytable import PrettyTable
 
+# matches a lone newline (not part of a paragraph break), for unwrapping template text
+_SINGLE_NL = re.compile(r"(?<!\n)\n(?!\n)")
+
+# reusable wrapper for AI prose shown to the user; textwrap.fill() builds a fresh
+# TextWrapper on every call, so hoist one out of the per-turn paths
+_FILL = textwrap.TextWrapper(width=88)
+
+# guard rails on AI-generated queries: despite the prompt's LIMIT 25 directive,
+# nothing stops the AI from emitting an unbounded scan
+MAX_ROWS = 1000
+MAX_QUERY_SECONDS = 30
+
+# largest result set worth rendering with PrettyTable (nicer look, but its
+# pure-Python column-width computation bogs down as rows pile up)
+PRETTY_MAX_ROWS = 200
+
+# SQL response cache: embedding model for the semantic tier, and the minimum cosine
+# similarity between intents to consider them equivalent
+EMBEDDING_MODEL = "text-embedding-3-small"
+SIMILARITY_THRESHOLD = 0.97
+
+# cheaper/faster model for intents that don't look like they need the full-strength
+# one, and the vocabulary that suggests otherwise
+FAST_MODEL = "gpt-4o-mini"
+_COMPLEX_INTENT = re.compile(
+    r"\b(join|group|window|over|partition|recursive|pivot|union|having|rank)\b",
+    re.IGNORECASE,
+)
+
+# SQL extraction from the AI response: a ```sql markdown fence it loves to emit, and
+# the semicolon-terminated SELECT/WITH statement itself
+_MD_FENCE = re.compile(r"```(?:sql)?\s*\n(.*?)\n\s*```", re.DOTALL)
+_SQL_RESPONSE = re.compile(
+    r"(?:[\n:`]|^)\s*((?:select|with)\b.*;)", re.IGNORECASE | re.DOTALL
+)
+
 STARTUP_PROMPT = [
     {
         "role": "system",
@@ -20,7 +64,7 @@ STARTUP_PROMPT = [
             You will analyze the following SQLite3 database schema to help the user
             understand it.
             
-            --SCHEMA--
+            {schema}
         """,
     },
     {
@@ -33,65 +77,41 @@ STARTUP_PROMPT = [
 ]
 
 MAIN_PROMPT = [
-    # NOTE: per https://platform.openai.com/docs/guides/chat/introduction gpt-3.5-turbo
-    # doesn't pay enough attention to directives in the system message, so we put more
-    # into the first user message.
+    # NOTE: the long, stable schema leads the system message so that every call in a
+    # session shares a byte-identical prefix, letting OpenAI's automatic prompt cache
+    # hit; the user intent and any revisions are strictly appended afterward.
     {
         "role": "system",
         "content": """
-            You will assist the user in writing an SQL query for a specific SQLite3
-            database schema.
-            Your answers will be directly input to sqlite3_prepare_v2(), so must
-            consist of semicolon-terminated SQL with no surrounding text, using only
-            syntax and function supported by SQLite3.
-            If you cannot fulfill the user's intention for any reason, then provide a
-            brief text explanation, without apology or other extraneous chatter.
-            Importantly, your SQL must never add, overwrite, alter, or delete anything
-            in the database, even if the user so demands.
-        """,
-    },
-    {
-        "role": "user",
-        "content": """
-            Assist me writing an SQL query for my SQLite3 database.
-            I will input your responses directly into SQLite3, so I require each
-            response to consist of one semicolon-terminated SQL query, with no
-            surrounding text, using only syntax and functions supported by SQLite3.
-            If a query is expected to yield multiple result rows, then set limit 25
-            unless I clearly request otherwise.
-            You may use common table expressions if they make the SQL much easier for
-            me to understand.
-            Due to the risk of infinite loop, don't use a recursive CTE unless
-            absolutely required to fulfill my intent.
-            I only want to query my database; if my input seems to suggest adding,
-            altering, overwriting, or deleting anything, then you must reject it.
-            If you're confident my input is a general question rather than a specific
-            database query, then do provide a brief text answer.
+            The user's SQLite3 database schema is:
 
-            My schema is:
+            {schema}
 
-            --SCHEMA--
-        """,
-    },
-    {
-        "role": "assistant",
-        "content": """
-            Schema acknowledged. Please state the nature of your intended database
-            query, using any mix of text and/or SQL.
+            You will assist the user in writing an SQL query for this database.
+            Your responses will be input directly into SQLite3, so each response must
+            consist of one semicolon-terminated SQL query, with no surrounding text,
+            using only syntax and functions supported by SQLite3.
+            If a query is expected to yield multiple result rows, then set limit 25
+            unless the user clearly requests otherwise.
+            You may use common table expressions if they make the SQL much easier to
+            understand.
+            Due to the risk of infinite loop, don't use a recursive CTE unless
+            absolutely required to fulfill the user's intent.
+            The user only wants to query the database; if their input seems to suggest
+            adding, altering, overwriting, or deleting anything, then you must reject
+            it.
+            If you're confident the user's input is a general question rather than a
+            specific database query, then do provide a brief text answer.
         """,
     },
-    {
-        "role": "user",
-        "content": "--INTENT--",
-    },
 ]
 
 REVISE_PROMPT = [
-    {"role": "assistant", "content": "--RESPONSE--"},
+    {"role": "assistant", "content": "{response}"},
     {
         "role": "user",
         "content": """
-            Revise your SQL to fix this error: --ERROR--
+            Revise your SQL to fix this error: {error}
 
             Output format: one semicolon-terminated SQL query with no surrounding text,
             using only SQL syntax and functions supported by SQLite3.
@@ -101,6 +121,24 @@ REVISE_PROMPT = [
 ]
 
 
+@lru_cache(maxsize=None)
+def _normalize(content):
+    # remove indentation from a prompt template & unwrap its single newlines.
+    # memoized since the inputs are the constant template strings, should anything
+    # ever normalize one outside the module-load pass below.
+    content = textwrap.dedent(content.strip("\n")).strip()
+    return _SINGLE_NL.sub(" ", content)
+
+
+# preprocess the (constant) templates once at import, leaving placeholders intact, so
+# prepare_prompt only has to substitute them on each REPL turn
+STARTUP_PROMPT_PREPARED = [
+    (m["role"], _normalize(m["content"])) for m in STARTUP_PROMPT
+]
+MAIN_PROMPT_PREPARED = [(m["role"], _normalize(m["content"])) for m in MAIN_PROMPT]
+REVISE_PROMPT_PREPARED = [(m["role"], _normalize(m["content"])) for m in REVISE_PROMPT]
+
+
 def main(argv=sys.argv):
     api_key = os.getenv("OPENAI_API_KEY", None)
     if not api_key:
@@ -110,7 +148,6 @@ def main(argv=sys.argv):
             file=sys.stderr,
         )
         return 1
-    openai.api_key = api_key
 
     parser = argparse.ArgumentParser(
         prog="ai4sqlite3",
@@ -137,6 +174,12 @@ def main(argv=sys.argv):
         help="OpenAI /v1/chat/completions model; see "
         "https://platform.openai.com/docs/models/model-endpoint-compatibility",
     )
+    parser.add_argument(
+        "--async-describe",
+        action="store_true",
+        help="request schema summary through the half-price OpenAI Batch API;"
+        " it's displayed on a later run once ready",
+    )
     parser.add_argument(
         "-r",
         "--revisions",
@@ -145,115 +188,462 @@ def main(argv=sys.argv):
         metavar="N",
         help="allow AI up to N attempts to produce valid SQL",
     )
+    parser.add_argument(
+        "--no-speculative",
+        action="store_false",
+        dest="speculative",
+        help="disable speculative backup/revision generations"
+        " (spends fewer tokens, adds latency to retries)",
+    )
+    parser.add_argument(
+        "--max-sql-tokens",
+        type=int,
+        default=512,
+        metavar="N",
+        help="cap on completion tokens per SQL generation",
+    )
     args = parser.parse_args(argv[1:])
 
-    # open database (read-only)
-    with sqlite3.connect(f"file:{args.dbfn}?mode=ro", uri=True) as dbc:
-        # read & describe schema
-        schema = read_schema(dbc)
-        if args.intro:
-            describe_schema(args.model, args.dbfn, schema)
+    # open database read-only & immutable -- assuming the file won't change during
+    # the session (reasonable for this CLI), SQLite can skip all locking and
+    # change-detection traffic and serve hot pages straight from mmap.
+    # check_same_thread=False because queries execute on asyncio.to_thread workers.
+    # Two connections: dbc for schema reads & EXPLAIN validation, qdbc dedicated to
+    # query execution so a long-running query never blocks the quick metadata work
+    # (and can be interrupted independently).
+    uri = f"file:{args.dbfn}?mode=ro&immutable=1"
+    with sqlite3.connect(uri, uri=True, check_same_thread=False) as dbc:
+        with sqlite3.connect(uri, uri=True, check_same_thread=False) as qdbc:
+            configure_connection(dbc)
+            configure_connection(qdbc)
+            # run the async REPL on the event loop; async OpenAI calls keep the loop
+            # (and thus the spinner & prompt) responsive during network round-trips
+            try:
+                return asyncio.run(amain(args, api_key, dbc, qdbc))
+            except KeyboardInterrupt:
+                # Ctrl-C outside the intent prompt (e.g. mid-generation): asyncio.run
+                # cancels the REPL task and re-raises KeyboardInterrupt out here
+                print()
+                return 0
+
+
+async def amain(args, api_key, dbc, qdbc):
+    # one shared HTTP/2 client for the whole session: the TLS handshake is paid once
+    # and describe/fetch/revise calls multiplex over the kept-alive socket. Tight
+    # connect/pool timeouts fail fast, while the read timeout accommodates slow
+    # generations; transient failures are retried with backoff by the openai client.
+    client = openai.AsyncOpenAI(
+        api_key=api_key,
+        max_retries=2,
+        http_client=httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=60),
+            timeout=httpx.Timeout(connect=5, read=60, write=10, pool=5),
+        ),
+    )
 
-        # enter main REPL
-        return main_repl(
-            args.model, dbc, schema, yes=args.yes, max_revisions=args.revisions
+    # read schema & start fetching its description in the background; main_repl
+    # displays it later, hiding the round-trip behind the user typing their first
+    # intent
+    schema = read_schema(dbc)
+    describe_task = (
+        asyncio.create_task(
+            print_description(client, args.model, schema, batch=args.async_describe)
         )
+        if args.intro
+        else None
+    )
+
+    # enter main REPL
+    return await main_repl(
+        client,
+        args.model,
+        dbc,
+        qdbc,
+        schema,
+        describe_task=describe_task,
+        cache=Cache(client),
+        yes=args.yes,
+        max_revisions=args.revisions,
+        max_sql_tokens=args.max_sql_tokens,
+        speculate=args.speculative,
+    )
 
 
-def main_repl(model, dbc, schema, yes=False, max_revisions=3):
+async def main_repl(
+    client,
+    model,
+    dbc,
+    qdbc,
+    schema,
+    describe_task=None,
+    cache=None,
+    yes=False,
+    max_revisions=3,
+    max_sql_tokens=512,
+    speculate=True,
+):
     # main REPL for separate queries until Ctrl+C/Ctrl+D
     stdin = prompt_toolkit.PromptSession()
+    # the schema-bearing prompt prefix is prepared once and shared (read-only) by all
+    # SQLPrompt instances in the session, keeping it byte-identical across calls for
+    # OpenAI's prompt cache
+    base_messages = prepare_prompt(MAIN_PROMPT_PREPARED, {"schema": schema})
+    schema_hash = hashlib.sha256(schema.encode()).hexdigest()
     first = True
     try:
-        while True:
-            # get user intent
-            intent = user_intent(stdin, first)
-            first = False
-
-            # prepare to prompt AI for SQL
-            sql_prompt = SQLPrompt(model, schema, intent)
-
-            # generate AI SQL, run it and show result table to user.
-            # inner loop: if SQLite rejects the SQL, feed the error message back to AI
-            # and ask it to revise, then retry (subject to max_revisions)
-            attempts = 0
+        # patch_stdout lets the background description task print itself above
+        # the intent prompt the moment it completes, instead of garbling the
+        # input line
+        with prompt_toolkit.patch_stdout.patch_stdout(raw=True):
             while True:
-                if (attempts := attempts + 1) > max_revisions:
-                    break
-                print()
-                with spinner(
-                    "Generating SQL"
-                    if attempts == 1
-                    else f"Regenerating SQL (attempt {attempts}/{max_revisions})"
-                ):
-                    # generate AI SQL
-                    got_sql, response = sql_prompt.fetch()
-                if not got_sql:
-                    print("\n" + textwrap.fill(response, width=88))
-                    break
-
-                print("\n" + response + "\n")
-                if yes or prompt_execute():
+                # get user intent
+                intent = await user_intent(stdin, first)
+                first = False
+
+                # prepare to prompt AI for SQL
+                sql_prompt = SQLPrompt(
+                    client,
+                    model,
+                    base_messages,
+                    schema_hash,
+                    intent,
+                    cache=cache,
+                    max_tokens=max_sql_tokens,
+                )
+
+                # generate AI SQL, run it and show result table to user.
+                # inner loop: if SQLite rejects the SQL, feed the error message
+                # back to AI and ask it to revise, then retry (max_revisions)
+                attempts = 0
+                speculative = None  # raw response pre-fetched by a speculative task
+                backup_task = None  # warm temperature-0.7 alternative generation
+                while True:
+                    if (attempts := attempts + 1) > max_revisions:
+                        break
+                    print()
+                    if speculative is not None:
+                        # use the response fetched by a speculative task
+                        sql_prompt.response = speculative
+                        got_sql, response = extract_sql(speculative)
+                        speculative = None
+                    else:
+                        if speculate and attempts == 1 and max_revisions > 1:
+                            # warm backup at temperature 0.7, ready immediately if
+                            # the primary temperature-0 attempt fails validation
+                            backup_task = asyncio.create_task(sql_prompt.fetch_backup())
+                        with spinner(
+                            "Generating SQL"
+                            if attempts == 1
+                            else (
+                                "Regenerating SQL"
+                                f" (attempt {attempts}/{max_revisions})"
+                            )
+                        ):
+                            # generate AI SQL; on the first turn, also finish the
+                            # background schema description (it prints itself, and
+                            # has usually already done so while the user typed)
+                            if describe_task is not None:
+                                _, (got_sql, response) = await asyncio.gather(
+                                    describe_task, sql_prompt.fetch()
+                                )
+                                describe_task = None
+                            else:
+                                got_sql, response = await sql_prompt.fetch()
+                        if backup_task is not None and sql_prompt.from_cache:
+                            # cache hit: the backup's tokens would be pure waste
+                            backup_task.cancel()
+                            backup_task = None
+                    if not got_sql:
+                        if backup_task is not None:
+                            backup_task.cancel()
+                        print("\n" + _FILL.fill(response))
+                        break
+
+                    print("\n" + response + "\n")
+
+                    # validate the SQL locally before bothering the user with the
+                    # EXECUTE? prompt: EXPLAIN triggers sqlite3_prepare_v2 (catching
+                    # syntax errors in microseconds) without doing any row work
                     try:
-                        with spinner("Executing query"):
-                            # Execute query & populate results table
-                            cursor = dbc.cursor()
-                            cursor.execute(response)
-                            table = results_table(cursor)
+                        dbc.execute("EXPLAIN " + response)
                     except (sqlite3.OperationalError, sqlite3.Warning) as exc:
-                        # feed error back to AI for revision
                         msg = str(exc)
-                        print("\nSQLite3 error: " + msg + "\n")
+                        print("SQLite3 error: " + msg + "\n")
                         sql_prompt.revise(msg)
+                        if backup_task is not None:
+                            # the warm backup stands in for a fresh revision call
+                            with spinner(
+                                f"Regenerating SQL (attempt {attempts + 1}"
+                                f"/{max_revisions})"
+                            ):
+                                speculative = await backup_task
+                            backup_task = None
                         continue  # inner loop
-                    # Show results table
-                    print(table)
-                break  # inner loop
+
+                    if yes or await prompt_execute():
+                        # while the query runs on a worker thread, speculatively
+                        # request a revision in case it fails -- overlapping the
+                        # OpenAI round-trip with SQLite execution time (unless the
+                        # warm backup is already standing by)
+                        spec_task = (
+                            asyncio.create_task(sql_prompt.fetch_speculative_revise())
+                            if speculate
+                            and backup_task is None
+                            and attempts < max_revisions
+                            else None
+                        )
+                        # Ctrl-C aborts the runaway query, not the REPL. Under
+                        # asyncio, SIGINT cancels the whole main task instead of
+                        # raising KeyboardInterrupt here, so take over the signal
+                        # for the duration of the query and route it to SQLite's
+                        # interrupt()
+                        sigint = False
+
+                        def on_sigint():
+                            nonlocal sigint
+                            sigint = True
+                            qdbc.interrupt()
+
+                        loop = asyncio.get_running_loop()
+                        loop.add_signal_handler(signal.SIGINT, on_sigint)
+                        try:
+                            with spinner("Executing query"):
+                                table = await asyncio.to_thread(
+                                    run_query, qdbc, response
+                                )
+                        except (sqlite3.OperationalError, sqlite3.Warning) as exc:
+                            msg = str(exc)
+                            if msg == "interrupted":
+                                # Ctrl-C or the progress-handler deadline pulled
+                                # the plug; not AI's fault either way
+                                for task in (spec_task, backup_task):
+                                    if task is not None:
+                                        task.cancel()
+                                print(
+                                    "\nQuery interrupted\n"
+                                    if sigint
+                                    else f"\nQuery canceled after"
+                                    f" {MAX_QUERY_SECONDS}s\n"
+                                )
+                                break
+                            # feed error back to AI for revision
+                            print("\nSQLite3 error: " + msg + "\n")
+                            sql_prompt.revise(msg)
+                            pending = backup_task or spec_task
+                            backup_task = None
+                            if pending is not None:
+                                with spinner(
+                                    f"Regenerating SQL (attempt {attempts + 1}"
+                                    f"/{max_revisions})"
+                                ):
+                                    speculative = await pending
+                            continue  # inner loop
+                        finally:
+                            # restores default Ctrl-C handling for the REPL
+                            loop.remove_signal_handler(signal.SIGINT)
+                        for task in (spec_task, backup_task):
+                            if task is not None:
+                                task.cancel()
+                        backup_task = None
+                        # Show results table & cache the successful generation
+                        print(table)
+                        sql_prompt.cache_store(response)
+                    elif backup_task is not None:
+                        # user declined: stop the warm backup from burning tokens
+                        backup_task.cancel()
+                    break  # inner loop
     except (KeyboardInterrupt, EOFError):
         # exiting main REPL
         print()
         return 0
 
 
+def configure_connection(dbc):
+    # performance pragmas for the read-only query workload: mmap serves page reads
+    # straight from the OS page cache, and the enlarged cache_size keeps user queries
+    # from thrashing. journal_mode=WAL no-ops under mode=ro but is kept in case the
+    # connection is ever opened writable.
+    for pragma in (
+        "journal_mode=WAL",
+        "synchronous=NORMAL",
+        "cache_size=-65536",
+        "temp_store=memory",
+        "mmap_size=268435456",
+        "query_only=1",  # belt & suspenders alongside the mode=ro open
+    ):
+        dbc.execute(f"PRAGMA {pragma}")
+
+
 def read_schema(dbc):
-    cursor = dbc.cursor()
-    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table';")
-    schema = cursor.fetchall()
-    return "\n".join(
-        [s.strip() for s in "".join([x[0] for x in schema]).splitlines() if s.strip()]
+    # compact, canonical one-line-per-table rendering of the schema: prompt tokens
+    # dominate both latency and cost, and the LLM rarely needs the DEFAULT/CHECK/
+    # COLLATE noise in the raw DDL. Format:
+    #   table(col:TYPE PK, col:TYPE NN FK->other.col, ...)
+    lines = []
+    for (table,) in dbc.execute(
+        "SELECT name FROM sqlite_master WHERE type='table'"
+        " AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    ):
+        fks = {
+            col: (other, other_col)
+            for other, col, other_col in dbc.execute(
+                'SELECT "table", "from", "to" FROM pragma_foreign_key_list(?)',
+                (table,),
+            )
+        }
+        cols = []
+        for name, ctype, notnull, pk in dbc.execute(
+            'SELECT name, type, "notnull", pk FROM pragma_table_info(?)', (table,)
+        ):
+            col = f"{name}:{ctype}" if ctype else name
+            if pk:
+                col += " PK"
+            if notnull:
+                col += " NN"
+            if name in fks:
+                other, other_col = fks[name]
+                # other_col is NULL when the FK references the other table's rowid pk
+                col += f" FK->{other}.{other_col}" if other_col else f" FK->{other}"
+            cols.append(col)
+        lines.append(f"{table}({', '.join(cols)})")
+    return "\n".join(lines)
+
+
+def cache_dir():
+    # ~/.cache/ai4sqlite3 (respecting $XDG_CACHE_HOME)
+    return os.path.join(
+        os.environ.get(
+            "XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")
+        ),
+        "ai4sqlite3",
+    )
+
+
+async def print_description(client, model, schema, batch=False):
+    # fetch & print the schema description; as a background task, the patch_stdout
+    # context in main_repl lets this print safely above the intent prompt the moment
+    # it completes
+    desc = await describe_schema(client, model, schema, batch=batch)
+    print("\n" + _FILL.fill(desc))
+
+
+async def describe_schema(client, model, schema, batch=False):
+    # ask AI to summarize the schema; main_repl displays the answer. Since the schema
+    # rarely changes between runs, descriptions are cached on disk keyed by a hash of
+    # (model, schema), skipping the round-trip on warm starts.
+    key = hashlib.blake2b(f"{model}\0{schema}".encode(), digest_size=16).hexdigest()
+    path = os.path.join(cache_dir(), key + ".txt")
+    try:
+        with open(path) as cached:
+            return cached.read()
+    except OSError:
+        pass
+    if batch:
+        return await describe_schema_batch(client, model, schema, key, path)
+    prompt = prepare_prompt(STARTUP_PROMPT_PREPARED, {"schema": schema})
+    # the prompt asks for ~100 words, so 200 tokens caps any rambling
+    stream = await client.chat.completions.create(
+        model=model, messages=prompt, stream=True, max_tokens=200
+    )
+    parts = []
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+    desc = "".join(parts)
+    write_cache_file(path, desc)
+    return desc
+
+
+async def describe_schema_batch(client, model, schema, key, path):
+    # the schema description isn't latency-critical, so --async-describe routes it
+    # through the Batch API at half price: submit on one run, collect (into the
+    # regular description cache) on a later one. A marker file next to the cache
+    # entry tracks the in-flight batch id.
+    marker = path + ".batch"
+    try:
+        with open(marker) as markerfile:
+            job_id = markerfile.read().strip()
+    except OSError:
+        job_id = None
+
+    if job_id:
+        job = await client.batches.retrieve(job_id)
+        if job.status == "completed" and job.output_file_id:
+            content = await client.files.content(job.output_file_id)
+            result = json.loads(content.text.splitlines()[0])
+            desc = result["response"]["body"]["choices"][0]["message"]["content"]
+            write_cache_file(path, desc)
+            try:
+                os.remove(marker)
+            except OSError:
+                pass
+            return desc
+        if job.status not in ("failed", "expired", "cancelled"):
+            return f"(schema description batch {job.status}; check back later)"
+        try:  # terminal failure: fall through to resubmission
+            os.remove(marker)
+        except OSError:
+            pass
+
+    request = {
+        "custom_id": key,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "messages": prepare_prompt(STARTUP_PROMPT_PREPARED, {"schema": schema}),
+            "max_tokens": 200,
+        },
+    }
+    upload = await client.files.create(
+        file=(f"{key}.jsonl", json.dumps(request).encode()), purpose="batch"
+    )
+    job = await client.batches.create(
+        input_file_id=upload.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
     )
+    write_cache_file(marker, job.id)
+    return "(schema description submitted via Batch API; check back on a later run)"
 
 
-def describe_schema(model, dbfn, schema):
-    # ask AI to summarize the schema, display it to user
-    with spinner(f"Analyzing schema of {os.path.basename(dbfn)} "):
-        prompt = prepare_prompt(STARTUP_PROMPT, {"--SCHEMA--": schema})
-        response = openai.ChatCompletion.create(model=model, messages=prompt)
-    desc = response.choices[0].message.content
-    print("\n" + textwrap.fill(desc, width=88))
+def write_cache_file(path, text):
+    try:  # cache write is best-effort
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmpfn = f"{path}.{os.getpid()}.tmp"
+        with open(tmpfn, "w") as tmpfile:
+            tmpfile.write(text)
+        os.replace(tmpfn, path)  # atomic
+    except OSError:
+        pass
 
 
 def spinner(title):
+    # the 20Hz ANSI repaint is pure overhead (and garbage in the output) when stdout
+    # isn't a terminal
     return alive_progress.alive_bar(
-        monitor=None, stats=None, bar=None, spinner="dots", title=title
+        monitor=None,
+        stats=None,
+        bar=None,
+        spinner="dots",
+        title=title,
+        disable=not sys.stdout.isatty(),
     )
 
 
 def prepare_prompt(template, subs):
-    # preprocess the prompt constants: remove indentation, unwrap text, substitute
-    # placeholders
-    prompt = deepcopy(template)
-    for msg in prompt:
-        content = msg["content"].strip("\n")
-        content = textwrap.dedent(content).strip()
-        content = re.sub(r"(?<!\n)\n(?!\n)", " ", content)
-        for k, v in subs.items():
-            content = content.replace(k, v)
-        msg["content"] = content
-    return prompt
-
-
-def user_intent(stdin, first=False):
+    # substitute placeholders into one of the *_PREPARED templates, building fresh
+    # message dicts; defaultdict(str) so an unused placeholder never raises
+    subs = defaultdict(str, subs)
+    return [
+        {"role": role, "content": content.format_map(subs)}
+        for role, content in template
+    ]
+
+
+async def user_intent(stdin, first=False):
     # ask user for their query intent
     prompt = (
         "Next query?"
@@ -262,54 +652,247 @@ def user_intent(stdin, first=False):
     )
     ans = None
     while not ans:
-        ans = stdin.prompt("\n" + prompt + "\n> ")
+        ans = await stdin.prompt_async("\n" + prompt + "\n> ")
     return ans
 
 
+class Cache:
+    # On-disk cache of previously successful SQL generations, keyed by (schema hash,
+    # model, intent): exact match on the normalized intent first, then embedding
+    # cosine similarity against cached intents for the same schema & model. All cache
+    # I/O is best-effort; any failure just means a fresh generation.
+    def __init__(self, client, path=None):
+        self.client = client
+        self.dbc = None
+        self._background = set()  # keeps fire-and-forget store tasks alive
+        path = path or os.path.join(cache_dir(), "cache.db")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.dbc = sqlite3.connect(path)
+            self.dbc.execute(
+                "CREATE TABLE IF NOT EXISTS sql_cache"
+                " (schema_hash TEXT, model TEXT, intent TEXT, embedding BLOB,"
+                " sql TEXT)"
+            )
+            self.dbc.execute(
+                "CREATE INDEX IF NOT EXISTS sql_cache_key"
+                " ON sql_cache(schema_hash, model, intent)"
+            )
+            self.dbc.commit()
+        except (sqlite3.Error, OSError):
+            self.dbc = None
+
+    async def lookup(self, schema_hash, model, intent):
+        # look up cached SQL for the intent; returns (sql or None, embedding or None),
+        # the embedding being reusable by store() if the caller generates fresh SQL
+        if self.dbc is None:
+            return None, None
+        intent = _normalize_intent(intent)
+        try:
+            row = self.dbc.execute(
+                "SELECT sql FROM sql_cache"
+                " WHERE schema_hash=? AND model=? AND intent=?",
+                (schema_hash, model, intent),
+            ).fetchone()
+            if row:
+                return row[0], None
+            candidates = self.dbc.execute(
+                "SELECT embedding, sql FROM sql_cache"
+                " WHERE schema_hash=? AND model=? AND embedding IS NOT NULL",
+                (schema_hash, model),
+            ).fetchall()
+        except sqlite3.Error:
+            return None, None
+        if not candidates:
+            # cold cache: nothing to compare against, so don't spend a network
+            # round-trip embedding the intent on the critical path (store() will
+            # embed it in the background after a successful generation)
+            return None, None
+        embedding = await self._embed(intent)
+        if embedding is None:
+            return None, None
+        # brute-force cosine search (OpenAI embeddings are unit-norm, so the dot
+        # product suffices); candidate counts here are small enough for pure Python
+        best_sql, best_score = None, SIMILARITY_THRESHOLD
+        for blob, sql in candidates:
+            cached = array.array("f")
+            cached.frombytes(blob)
+            score = sum(x * y for x, y in zip(embedding, cached))
+            if score >= best_score:
+                best_sql, best_score = sql, score
+        return best_sql, embedding
+
+    async def _embed(self, intent):
+        try:
+            response = await self.client.embeddings.create(
+                model=EMBEDDING_MODEL, input=intent
+            )
+            return array.array("f", response.data[0].embedding)
+        except openai.OpenAIError:
+            return None
+
+    def store(self, schema_hash, model, intent, embedding, sql):
+        if self.dbc is None:
+            return
+        if embedding is None:
+            # lookup() didn't need the embedding, so compute it now -- in a
+            # background task, off the critical path of showing the results
+            task = asyncio.create_task(
+                self._embed_and_store(schema_hash, model, intent, sql)
+            )
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+            return
+        self._insert(schema_hash, model, intent, embedding, sql)
+
+    async def _embed_and_store(self, schema_hash, model, intent, sql):
+        embedding = await self._embed(_normalize_intent(intent))
+        self._insert(schema_hash, model, intent, embedding, sql)
+
+    def _insert(self, schema_hash, model, intent, embedding, sql):
+        try:
+            self.dbc.execute(
+                "INSERT INTO sql_cache VALUES (?,?,?,?,?)",
+                (
+                    schema_hash,
+                    model,
+                    _normalize_intent(intent),
+                    embedding.tobytes() if embedding is not None else None,
+                    sql,
+                ),
+            )
+            self.dbc.commit()
+        except sqlite3.Error:
+            pass
+
+
+def _normalize_intent(intent):
+    return " ".join(intent.split()).lower()
+
+
+def classify_complexity(intent):
+    # crude but cheap heuristics: long intents or relational-algebra vocabulary get
+    # the full-strength model, everything else the fast one
+    if len(intent) > 200 or _COMPLEX_INTENT.search(intent):
+        return "complex"
+    return "simple"
+
+
 class SQLPrompt:
     # Manages our AI prompt for SQL given the user intent, including revisions after
     # receiving invalid/erroneous SQL back.
-    def __init__(self, model, schema, intent):
-        self.model = model
-        self.schema = schema
+    def __init__(
+        self,
+        client,
+        model,
+        base_messages,
+        schema_hash,
+        intent,
+        cache=None,
+        max_tokens=512,
+    ):
+        self.client = client
+        # simple intents go to the cheap model; revise() escalates back to the
+        # user-selected model if the first attempt fails
+        self.full_model = model
+        self.model = FAST_MODEL if classify_complexity(intent) == "simple" else model
+        # cache entries are keyed by the routing-time model, which (unlike
+        # self.model, mutated by revise()) is reproducible on a later run of the
+        # same intent
+        self.cache_model = self.model
         self.intent = intent
-
-        self.messages = prepare_prompt(
-            MAIN_PROMPT, {"--SCHEMA--": schema, "--INTENT--": intent}
-        )
+        self.cache = cache
+        self.schema_hash = schema_hash
+        self.max_tokens = max_tokens
+        self.response = None
+        self.from_cache = False
+        self.cached_embedding = None
+
+        # appending to the shared (never-mutated) prefix keeps the schema portion
+        # byte-identical across all intents & revisions in the session
+        self.messages = base_messages + [{"role": "user", "content": intent}]
         assert self.messages
 
-    def fetch(self):
-        envelope = openai.ChatCompletion.create(
-            model=self.model, messages=self.messages
+    async def _complete(self, messages, temperature=0):
+        # stream the completion, accumulating delta chunks as they arrive rather than
+        # waiting for the server to finish the whole message. temperature=0 minimizes
+        # the odds of a gratuitously wrong first attempt (and thus a revision
+        # round-trip); max_tokens bounds latency, which is linear in tokens generated
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            temperature=temperature,
+            max_tokens=self.max_tokens,
         )
-        self.response = envelope.choices[0].message.content.strip()
-        # Despite our repeated instructions, the AI sometimes gabs before and/or after
-        # the SQL. Good-enough regexp to ignore that:
-        matches = re.findall(
-            r"(?:[\n:`]|^)\s*((?:select|with)\b.*;)",
-            self.response,
-            re.IGNORECASE | re.DOTALL,
+        parts = []
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+        return "".join(parts).strip()
+
+    async def fetch(self):
+        if self.cache is not None and self.response is None:
+            # first attempt: check the response cache before going to the network
+            sql, self.cached_embedding = await self.cache.lookup(
+                self.schema_hash, self.cache_model, self.intent
+            )
+            if sql is not None:
+                self.response = sql
+                self.from_cache = True
+                return True, sql
+        self.response = await self._complete(self.messages)
+        return extract_sql(self.response)
+
+    def cache_store(self, sql):
+        # record a successfully executed generation (no-op for cache hits)
+        if self.cache is not None and not self.from_cache:
+            self.cache.store(
+                self.schema_hash,
+                self.cache_model,
+                self.intent,
+                self.cached_embedding,
+                sql,
+            )
+
+    async def fetch_backup(self):
+        # an independent temperature-0.7 sample of the same prompt, fetched
+        # concurrently with the primary attempt as latency insurance: if the primary
+        # fails validation/execution, this alternative is ready without another
+        # round-trip (its sunk token cost is accepted; see --no-speculative)
+        return await self._complete(self.messages, temperature=0.7)
+
+    async def fetch_speculative_revise(self):
+        # speculative revision assuming a generic error, requested while the current
+        # SQL is still executing; main_repl uses it only if execution actually fails
+        # (and then records the real error via revise() for subsequent context)
+        messages = self.messages + prepare_prompt(
+            REVISE_PROMPT_PREPARED,
+            {"response": self.response, "error": "syntax error"},
         )
-        if matches:
-            return True, max(matches, key=len)
-        return False, self.response
+        return await self._complete(messages)
 
     def revise(self, error_msg):
+        # escalate to the full-strength model rather than retrying the same tier
+        self.model = self.full_model
         # prepare prompt to revise the previous response given error_msg.
         # to test this path, try entering:
         #   an interesting query of your choice. on your first response, deliberately
         #   introduce an error in your SQL. then I'll ask you to fix it.
         assert self.messages and self.messages[-1]["role"] == "user"
         self.messages += prepare_prompt(
-            REVISE_PROMPT, {"--RESPONSE--": self.response, "--ERROR--": error_msg}
+            REVISE_PROMPT_PREPARED,
+            {"response": self.response, "error": error_msg},
         )
 
 
-def prompt_execute():
+async def prompt_execute():
     while True:
         print("EXECUTE?\n(Y/N) > ", end="", flush=True)
-        user_input = getch.getch()
+        # getch blocks in raw terminal mode; run it on a worker thread so background
+        # tasks (schema description, speculative generations) keep making progress
+        user_input = await asyncio.to_thread(getch.getch)
         print()
         if user_input.lower() == "y":
             return True
@@ -317,13 +900,63 @@ def prompt_execute():
             return False
 
 
+def extract_sql(text):
+    # Despite our repeated instructions, the AI sometimes gabs before and/or after
+    # the SQL. Good-enough regexps to ignore that, preferring the contents of a
+    # markdown code fence when one is present:
+    fence = _MD_FENCE.search(text)
+    matches = _SQL_RESPONSE.findall(fence.group(1) if fence else text)
+    if not matches and fence:
+        matches = _SQL_RESPONSE.findall(text)
+    if matches:
+        return True, max(matches, key=len)
+    return False, text
+
+
+def run_query(dbc, sql):
+    # execute the AI's SQL & populate the results table. Runs on a worker thread
+    # (hence check_same_thread=False on the connection) so the event loop, spinner,
+    # and any speculative OpenAI tasks stay live during long queries.
+    cursor = dbc.cursor()
+    deadline = time.monotonic() + MAX_QUERY_SECONDS
+    dbc.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+    try:
+        cursor.execute(limit_query(sql))
+        return results_table(cursor)
+    finally:
+        dbc.set_progress_handler(None, 0)
+
+
+def limit_query(sql):
+    # wrap the AI's SQL to cap the result set at MAX_ROWS (fetching one extra row so
+    # results_table can tell truncation from an exact-size result)
+    return f"SELECT * FROM (\n{sql.rstrip().rstrip(';')}\n) LIMIT {MAX_ROWS + 1}"
+
+
 def results_table(cursor):
     # SQLite result column names may not be unique, but PrettyTable needs them to be
     columns = make_unique([description[0] for description in cursor.description])
-    table = PrettyTable(columns)
-    for row in cursor.fetchall():
-        table.add_row(row)
-    return table
+    # stream rows in chunks instead of fetchall(), avoiding a second full-materialized
+    # copy of the result set alongside the renderer's own storage
+    cursor.arraysize = 1000
+    rows = []
+    while chunk := cursor.fetchmany():
+        rows.extend(chunk)
+    truncated = len(rows) > MAX_ROWS
+    if truncated:
+        del rows[MAX_ROWS:]
+    if len(rows) <= PRETTY_MAX_ROWS:
+        table = PrettyTable(columns)
+        table.add_rows(rows)
+        rendered = str(table)
+    else:
+        # beyond that, plain TSV renders in one pass
+        out = ["\t".join(columns)]
+        out.extend("\t".join(str(v) for v in row) for row in rows)
+        rendered = "\n".join(out)
+    if truncated:
+        rendered += f"\n... (truncated to first {MAX_ROWS} rows)"
+    return rendered
 
 
 def make_unique(lst):